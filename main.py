@@ -1,36 +1,231 @@
 import streamlit as st
-import pandas as pd
-from agent import create_agent, AgentState
 from io import BytesIO
+import uuid
+import warnings
+
+# pandas, numpy and the agent are imported once a file is uploaded (see Main
+# Logic) so the landing page renders without paying for them.
+
+# Row count above which the optional numba/Polars paths kick in
+LARGE_FRAME_ROWS = 1_000_000
+
+# Dtypes treated as text (pandas 3 reads strings as 'str', not 'object')
+TEXT_DTYPES = ['object', 'string']
+
+# Text columns that are expected to be non-numeric
+CATEGORICAL_NAMES = frozenset({"customer", "region", "product", "category"})
 
 # ------------------- Utility Functions -------------------
 
-def validate_data(df):
-    """Check dataset for missing values, mixed types, and outliers."""
+@st.cache_data(show_spinner=False, max_entries=8)
+def _load_csv(raw: bytes) -> "pd.DataFrame":
+    """Parse uploaded CSV bytes; cached so reruns skip re-parsing."""
+    try:
+        # Multithreaded Arrow reader; falls back if pyarrow is missing or the file trips it up
+        df = pd.read_csv(BytesIO(raw), engine="pyarrow")
+    except (ImportError, ValueError):
+        return pd.read_csv(BytesIO(raw))
+    # Take column names from the C engine's header parse so blank and repeated
+    # headers get the usual "Unnamed: 0" / "a.1" names
+    columns = pd.read_csv(BytesIO(raw), nrows=0).columns
+    if len(columns) != len(df.columns):
+        return pd.read_csv(BytesIO(raw))
+    df.columns = columns
+    return df
+
+
+def _hash_df(df):
+    """Content hash for DataFrames passed to cached functions."""
+    return tuple(df.columns), pd.util.hash_pandas_object(df, index=True).values.tobytes()
+
+
+# Keyed by name so the decorators below don't need pandas imported
+# (DataFrame's qualified name moved from pandas.core.frame in pandas 3)
+DF_HASH_FUNCS = {"pandas.core.frame.DataFrame": _hash_df, "pandas.DataFrame": _hash_df}
+
+
+@st.cache_data(show_spinner=False, max_entries=8, hash_funcs=DF_HASH_FUNCS)
+def _df_to_csv(df):
+    """Serialize the working DataFrame for the agent; cached per content."""
+    return df.to_csv(index=False)
+
+
+@st.cache_resource
+def _get_agent():
+    """Build the LangGraph agent once per process and share it across sessions."""
+    from agent import create_agent
+    return create_agent()
+
+
+@st.cache_resource
+def _polars():
+    """Import Polars on first use; None if it is not installed."""
+    try:
+        import polars
+    except ImportError:
+        return None
+    return polars
+
+
+@st.cache_resource
+def _iqr_kernel():
+    """Compile the numba IQR kernel on first use; None if numba is not installed."""
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit(cache=True)
+    def select_quantile(col, p):
+        """Linearly interpolated quantile via partial selection, matching np.quantile."""
+        pos = p * (col.size - 1)
+        k = int(pos)
+        part = np.partition(col, k)
+        value = part[k]
+        if k + 1 < col.size:
+            value += (pos - k) * (part[k + 1:].min() - value)
+        return value
+
+    @numba.njit(parallel=True, cache=True)
+    def iqr_bounds(arr):
+        n_cols = arr.shape[1]
+        lower = np.full(n_cols, np.nan)
+        upper = np.full(n_cols, np.nan)
+        for j in numba.prange(n_cols):
+            col = arr[:, j]
+            col = col[~np.isnan(col)]
+            if col.size:
+                q1 = select_quantile(col, 0.25)
+                q3 = select_quantile(col, 0.75)
+                iqr = q3 - q1
+                lower[j] = q1 - 1.5 * iqr
+                upper[j] = q3 + 1.5 * iqr
+        return lower, upper
+
+    return iqr_bounds
+
+
+def _iqr_bounds(arr):
+    """Per-column (lower, upper) IQR fences for a 2-D float array, ignoring NaNs."""
+    kernel = _iqr_kernel() if arr.shape[0] >= LARGE_FRAME_ROWS else None
+    if kernel is not None:
+        return kernel(np.asfortranarray(arr))
+    with warnings.catch_warnings():
+        # Entirely empty columns give NaN fences (nothing flagged), as Series.quantile did
+        warnings.simplefilter("ignore", RuntimeWarning)
+        Q1, Q3 = np.nanquantile(arr, [0.25, 0.75], axis=0)
+    IQR = Q3 - Q1
+    return Q1 - 1.5 * IQR, Q3 + 1.5 * IQR
+
+
+def _numeric_view(df):
+    """Numeric block of the frame (all numeric dtypes, incl. nullable/Arrow)."""
+    return df.select_dtypes(include='number')
+
+
+def _missing_counts(df):
+    """Missing-value count per column, for columns that have any."""
+    counts = df.isna().to_numpy().sum(axis=0)
+    has_missing = counts > 0
+    return dict(zip(df.columns[has_missing], counts[has_missing].tolist()))
+
+
+def _drop_duplicates(df, subset=None):
+    """drop_duplicates(subset), run multi-threaded through Polars on large frames."""
+    pl = _polars() if len(df) >= LARGE_FRAME_ROWS else None
+    if pl is not None:
+        try:
+            key = df if subset is None else df[list(subset)]
+            first = pl.from_pandas(key).select(pl.struct(pl.all()).is_first_distinct())
+            return df.loc[first.to_series().to_numpy()]
+        except (TypeError, ValueError, pl.exceptions.PolarsError):
+            pass  # columns Polars cannot represent; use pandas
+    return df.drop_duplicates(subset=subset)
+
+
+def _downcast(df, numeric_cols):
+    """Shrink numeric columns to the smallest dtype that holds their values."""
+    int_cols = [c for c in numeric_cols if pd.api.types.is_integer_dtype(df[c])]
+    if int_cols:
+        df[int_cols] = df[int_cols].apply(pd.to_numeric, downcast='integer')
+
+    # Floats go to float32 only when every value survives the cast exactly;
+    # to_numeric(downcast='float') tolerates rounding, so it is not used here
+    float_cols = []
+    for c in numeric_cols:
+        if pd.api.types.is_float_dtype(df[c]):
+            values = df[c].to_numpy(dtype='float64', na_value=np.nan)
+            if np.array_equal(values.astype('float32'), values, equal_nan=True):
+                float_cols.append(c)
+    if float_cols:
+        df[float_cols] = df[float_cols].astype('float32')
+    return df
+
+
+def _fill_and_filter(df, numeric_cols):
+    """Median-fill numeric gaps, then drop rows outside the IQR fences.
+
+    Large frames run this as one lazy Polars query when Polars is installed.
+    """
+    pl = _polars() if len(numeric_cols) and len(df) >= LARGE_FRAME_ROWS else None
+    if pl is not None:
+        try:
+            cols = list(numeric_cols)
+            lf = pl.from_pandas(df[cols]).lazy().with_columns(
+                pl.col(c).fill_null(pl.col(c).median()) for c in cols if df[c].dtype.kind == "f"
+            )
+            in_range = []
+            for c in cols:
+                Q1 = pl.col(c).quantile(0.25, "linear")
+                Q3 = pl.col(c).quantile(0.75, "linear")
+                in_range.append(pl.col(c).is_between(Q1 - 1.5 * (Q3 - Q1), Q3 + 1.5 * (Q3 - Q1)))
+            filled, keep = pl.collect_all([lf, lf.select(pl.all_horizontal(in_range).fill_null(False))])
+            df = df.assign(**{c: filled.get_column(c).to_numpy() for c in cols})
+            return df.loc[keep.to_series().to_numpy()]
+        except (TypeError, ValueError, pl.exceptions.PolarsError):
+            pass  # columns Polars cannot represent; use pandas
+
+    # Fill missing values with median (only columns that have gaps)
+    fill_cols = list(_missing_counts(df[numeric_cols]))
+    if fill_cols:
+        df[fill_cols] = df[fill_cols].fillna(df[fill_cols].median())
+
+    # Remove outliers (IQR), with bounds taken once from the filled data
+    if len(numeric_cols) and len(df):
+        arr = df[numeric_cols].to_numpy(dtype=float, na_value=np.nan)
+        lower, upper = _iqr_bounds(arr)
+        keep = ((arr >= lower) & (arr <= upper)).all(axis=1)
+        df = df.loc[keep]
+    return df
+
+
+def validate_data(df, numeric):
+    """Check dataset for missing values, mixed types, and outliers.
+
+    ``numeric`` is ``_numeric_view(df)``.
+    """
     report = []
     issues_found = False
 
     # Missing values
-    missing = df.isnull().sum()
-    if missing.any():
+    missing = _missing_counts(df)
+    if missing:
         issues_found = True
-        report.append(f"Missing values detected: {missing[missing > 0].to_dict()}")
+        report.append(f"Missing values detected: {missing}")
 
     # Mixed types in numeric-like columns
-    for col in df.columns:
-        if df[col].dtype == 'object' and col.lower() not in ['customer', 'region', 'product', 'category']:
+    for col in df.select_dtypes(include=TEXT_DTYPES).columns:
+        if col.lower() not in CATEGORICAL_NAMES:
             issues_found = True
             report.append(f"Column '{col}' has non-numeric data that may affect calculations.")
 
     # Detect outliers (IQR method)
-    numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
     outlier_cols = []
-    for col in numeric_cols:
-        Q1, Q3 = df[col].quantile(0.25), df[col].quantile(0.75)
-        IQR = Q3 - Q1
-        outliers = df[(df[col] < Q1 - 1.5 * IQR) | (df[col] > Q3 + 1.5 * IQR)]
-        if not outliers.empty:
-            outlier_cols.append(col)
+    if numeric.size:
+        arr = numeric.to_numpy(dtype=float, na_value=np.nan)
+        lower, upper = _iqr_bounds(arr)
+        mask = (arr < lower) | (arr > upper)
+        outlier_cols = numeric.columns[mask.any(axis=0)].tolist()
     if outlier_cols:
         issues_found = True
         report.append(f"Outliers detected in: {', '.join(outlier_cols)}")
@@ -38,30 +233,30 @@ def validate_data(df):
     return issues_found, report
 
 
-def auto_correct_data(df):
-    """Automatically clean the dataset for better accuracy."""
-    df = df.drop_duplicates()  # Remove duplicates
+# Cleaned frames are also pickled to Streamlit's cache folder so they survive
+# restarts. max_entries only bounds the in-memory layer: the disk copies (user
+# data) are never evicted. Remove them with `streamlit cache clear`.
+@st.cache_data(show_spinner=False, max_entries=8, persist="disk", hash_funcs=DF_HASH_FUNCS)
+def auto_correct_data(df, _numeric, subset=None):
+    """Automatically clean the dataset for better accuracy.
 
-    # Convert numeric-like columns
-    for col in df.columns:
-        if df[col].dtype == 'object':
-            try:
-                df[col] = pd.to_numeric(df[col], errors='ignore')
-            except:
-                pass
+    ``_numeric`` is ``_numeric_view(df)`` for the uncorrected frame. ``subset``
+    limits duplicate detection to those key columns (default: whole rows).
+    """
+    df = _drop_duplicates(df, subset)  # Remove duplicates
 
-    # Fill missing values with median
-    numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
-    for col in numeric_cols:
-        df[col].fillna(df[col].median(), inplace=True)
+    # Convert numeric-like columns (only those where every value parses)
+    numeric_cols = _numeric.columns
+    obj = df.select_dtypes(include=TEXT_DTYPES)
+    if len(obj.columns):
+        converted = obj.apply(pd.to_numeric, errors='coerce')
+        parsed = (converted.notna() | obj.isna()).all()
+        df[parsed.index[parsed]] = converted.loc[:, parsed]
+        numeric_cols = df.columns[df.columns.isin(numeric_cols) | df.columns.isin(parsed.index[parsed])]
 
-    # Remove outliers (IQR)
-    for col in numeric_cols:
-        Q1, Q3 = df[col].quantile(0.25), df[col].quantile(0.75)
-        IQR = Q3 - Q1
-        df = df[(df[col] >= Q1 - 1.5 * IQR) & (df[col] <= Q3 + 1.5 * IQR)]
+    df = _fill_and_filter(df, numeric_cols)
 
-    return df
+    return _downcast(df, numeric_cols)
 
 # ------------------- Streamlit App -------------------
 
@@ -111,14 +306,19 @@ if "df" not in st.session_state:
     st.session_state.df = None
 if "uploaded_file" not in st.session_state:
     st.session_state.uploaded_file = None
+if "raw_df" not in st.session_state:
+    st.session_state.raw_df = None
+if "validation" not in st.session_state:
+    st.session_state.validation = None
 if "analysis_history" not in st.session_state:
     st.session_state.analysis_history = []
 if "visualization_history" not in st.session_state:
     st.session_state.visualization_history = []
 if "summary_history" not in st.session_state:
     st.session_state.summary_history = []
-
-agent = create_agent()
+if "thread_id" not in st.session_state:
+    # The agent is shared process-wide; give each session its own checkpoint thread
+    st.session_state.thread_id = str(uuid.uuid4())
 
 # ------------------- Landing Page -------------------
 if st.session_state.df is None:
@@ -152,6 +352,8 @@ else:
     # Back button
     if st.button("⬅ Back to Upload"):
         st.session_state.df = None
+        st.session_state.raw_df = None
+        st.session_state.validation = None
         st.session_state.uploaded_file = None
         st.session_state.analysis_history.clear()
         st.session_state.visualization_history.clear()
@@ -160,14 +362,27 @@ else:
 
 # ------------------- Main Logic -------------------
 if st.session_state.uploaded_file:
-    st.session_state.df = pd.read_csv(BytesIO(st.session_state.uploaded_file))
+    import numpy as np
+    import pandas as pd
+    from agent import AgentState
+
+    agent = _get_agent()
+
+    # Parse and validate once per upload. raw_df stays untouched so both
+    # choices below always start from the uploaded data; df is the working copy.
+    if st.session_state.raw_df is None:
+        raw_df = _load_csv(st.session_state.uploaded_file)
+        st.session_state.raw_df = raw_df
+        st.session_state.df = raw_df
+        st.session_state.validation = validate_data(raw_df, _numeric_view(raw_df))
+    raw_df = st.session_state.raw_df
     df = st.session_state.df
 
     st.write("### Data Preview")
-    st.dataframe(df.head())
+    st.dataframe(df.head(20), width="stretch")
 
     # Validate data
-    issues_found, report = validate_data(df)
+    issues_found, report = st.session_state.validation
     if issues_found:
         st.warning("⚠ Data Issues Detected:")
         for issue in report:
@@ -176,12 +391,13 @@ if st.session_state.uploaded_file:
         col1, col2 = st.columns(2)
         with col1:
             if st.button("✅ Auto-Correct Data"):
-                df = auto_correct_data(df)
+                df = auto_correct_data(raw_df, _numeric_view(raw_df))
                 st.success("✅ Data cleaned successfully! Analysis will be more accurate now.")
                 st.session_state.df = df
         with col2:
             if st.button("❌ Keep Original Data"):
                 st.info("Using original dataset without corrections.")
+                df = raw_df
                 st.session_state.df = df
     else:
         st.success("✅ No major issues found in your data.")
@@ -211,9 +427,9 @@ if st.session_state.uploaded_file:
             user_query = st.chat_input("Ask an analysis question...")
             if user_query:
                 try:
-                    df_csv = st.session_state.df.to_csv(index=False)
+                    df_csv = _df_to_csv(st.session_state.df)
                     state = AgentState(user_query=user_query, intent="analysis", df=df_csv)
-                    result_state = agent.invoke(state, config={"configurable": {"thread_id": "session-1"}})
+                    result_state = agent.invoke(state, config={"configurable": {"thread_id": st.session_state.thread_id}})
 
                     answer = result_state.get("raw_result", result_state.get("result", "No result returned"))
                     code = result_state.get("generated_code", None)
@@ -237,9 +453,9 @@ if st.session_state.uploaded_file:
             viz_query = st.chat_input("Ask for a visualization...")
             if viz_query:
                 try:
-                    df_csv = st.session_state.df.to_csv(index=False)
+                    df_csv = _df_to_csv(st.session_state.df)
                     state = AgentState(user_query=viz_query, intent="visualization", df=df_csv)
-                    result_state = agent.invoke(state, config={"configurable": {"thread_id": "session-1"}})
+                    result_state = agent.invoke(state, config={"configurable": {"thread_id": st.session_state.thread_id}})
 
                     fig = result_state.get("result", None)
                     code = result_state.get("generated_code", None)
@@ -267,9 +483,9 @@ if st.session_state.uploaded_file:
             summary_query = st.chat_input("Ask about summary or insights...")
             if summary_query:
                 try:
-                    df_csv = st.session_state.df.to_csv(index=False)
+                    df_csv = _df_to_csv(st.session_state.df)
                     state = AgentState(user_query=summary_query, intent="summary", df=df_csv)
-                    result_state = agent.invoke(state, config={"configurable": {"thread_id": "session-1"}})
+                    result_state = agent.invoke(state, config={"configurable": {"thread_id": st.session_state.thread_id}})
 
                     answer = result_state.get("result", "No summary returned")
                     st.session_state.summary_history.append((summary_query, answer))